@@ -0,0 +1,13 @@
+import os
+import types
+from functools import lru_cache
+from typing import Mapping
+
+from dotenv import load_dotenv
+
+
+@lru_cache(maxsize=1)
+def load() -> Mapping[str, str]:
+    """Apply .env to the process environment once and return a read-only snapshot"""
+    load_dotenv()
+    return types.MappingProxyType(dict(os.environ))
@@ -4,11 +4,12 @@ Sample metrics generator for demonstration purposes.
 This creates sample Excel files to show the metrics reporting capability.
 """
 
+import argparse
 import time
-import random
+import numpy as np
 from metrics_logger import MetricsLogger
 
-def generate_sample_metrics():
+def generate_sample_metrics(num_turns: int = 5, realistic: bool = False):
     """Generate sample conversation metrics for demonstration"""
     
     print("🎯 Generating sample metrics for demonstration...")
@@ -17,24 +18,27 @@ def generate_sample_metrics():
     metrics_logger = MetricsLogger()
     metrics_logger.start_session()
     
-    # Simulate a conversation with 5 turns
-    for turn in range(1, 6):
+    # Generate realistic latency values for every turn at once
+    rng = np.random.default_rng()
+    eou_delays = rng.uniform(0.1, 0.4, num_turns)  # STT processing time
+    ttfts = rng.uniform(0.3, 1.2, num_turns)       # LLM first token time
+    ttfbs = rng.uniform(0.1, 0.3, num_turns)       # TTS first byte time
+    total_latencies = eou_delays + ttfts + ttfbs + rng.uniform(0.1, 0.3, num_turns)
+    interrupted = rng.random(num_turns) < 0.25     # 25% interruption rate
+    
+    # Simulate a conversation
+    for i in range(num_turns):
+        turn = i + 1
         print(f"  📊 Generating turn {turn} metrics...")
         
-        # Generate realistic latency values
-        eou_delay = random.uniform(0.1, 0.4)  # STT processing time
-        ttft = random.uniform(0.3, 1.2)       # LLM first token time
-        ttfb = random.uniform(0.1, 0.3)       # TTS first byte time
-        total_latency = eou_delay + ttft + ttfb + random.uniform(0.1, 0.3)
-        
         # Create turn metrics
         turn_metrics = {
             'turn_number': turn,
-            'eou_delay': eou_delay,
-            'ttft': ttft,
-            'ttfb': ttfb,
-            'total_latency': total_latency,
-            'interrupted': random.choice([False, False, False, True]),  # 25% interruption rate
+            'eou_delay': float(eou_delays[i]),
+            'ttft': float(ttfts[i]),
+            'ttfb': float(ttfbs[i]),
+            'total_latency': float(total_latencies[i]),
+            'interrupted': bool(interrupted[i]),
             'agent_response': f"Sample response for turn {turn}",
             'user_input': f"User question {turn}",
             'timestamp': time.time()
@@ -42,14 +46,16 @@ def generate_sample_metrics():
         
         metrics_logger.add_turn_metrics(turn_metrics)
         
-        # Simulate some delay between turns
-        time.sleep(0.5)
+        # Optionally simulate some delay between turns
+        if realistic:
+            time.sleep(0.5)
     
     # Generate session summary
+    interrupted_turns = int(interrupted.sum())
     session_summary = {
-        'total_turns': 5,
-        'successful_turns': 4,
-        'interrupted_turns': 1,
+        'total_turns': num_turns,
+        'successful_turns': num_turns - interrupted_turns,
+        'interrupted_turns': interrupted_turns,
         'config': {
             'stt': 'deepgram',
             'llm': 'groq', 
@@ -67,4 +73,8 @@ def generate_sample_metrics():
     print("🎉 This demonstrates the full metrics logging capability")
 
 if __name__ == "__main__":
-    generate_sample_metrics() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate sample voice agent metrics")
+    parser.add_argument("--turns", type=int, default=5, help="number of conversation turns to simulate")
+    parser.add_argument("--realistic", action="store_true", help="pause between turns like a live conversation")
+    args = parser.parse_args()
+    generate_sample_metrics(args.turns, args.realistic) 
\ No newline at end of file
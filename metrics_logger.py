@@ -1,18 +1,29 @@
-import pandas as pd
-import openpyxl
+import numpy as np
 from datetime import datetime
 import os
-from typing import Dict, List, Any
+import time
+from typing import TYPE_CHECKING, Dict, List, Any
 import logging
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 logger = logging.getLogger(__name__)
 
+# Per-turn latency fields kept as columnar arrays
+LATENCY_METRICS = ('total_latency', 'eou_delay', 'ttft', 'ttfb')
+INITIAL_TURN_CAPACITY = 1024
+
+# Sessions longer than this write turn details to Parquet instead of the workbook
+PARQUET_TURN_THRESHOLD = 1000
+
 class MetricsLogger:
     def __init__(self, output_dir: str = "metrics"):
         self.output_dir = output_dir
         self.session_data = {}
         self.turn_metrics = []
         self.session_start_time = None
+        self._reset_turn_buffers()
         
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
@@ -20,6 +31,7 @@ class MetricsLogger:
     def start_session(self):
         """Initialize a new session"""
         self.session_start_time = datetime.now()
+        self._start_monotonic = time.monotonic()
         self.session_data = {
             'session_id': self.session_start_time.strftime("%Y%m%d_%H%M%S"),
             'start_time': self.session_start_time,
@@ -33,12 +45,17 @@ class MetricsLogger:
             'avg_ttft': 0,
             'avg_ttfb': 0,
             'max_latency': 0,
-            'min_latency': float('inf'),
+            'min_latency': 0,
             'high_latency_turns': 0,
+            'p50_latency': 0,
+            'p95_latency': 0,
+            'p99_latency': 0,
+            'greeting_latency': None,
             'config': {}
         }
         self.turn_metrics = []
-        logger.info(f"Started new session: {self.session_data['session_id']}")
+        self._reset_turn_buffers()
+        logger.info("Started new session: %s", self.session_data['session_id'])
     
     def add_turn_metrics(self, metrics: Dict[str, Any]):
         """Add metrics for a single conversation turn"""
@@ -46,12 +63,13 @@ class MetricsLogger:
             logger.warning("Session not started. Call start_session() first.")
             return
         
-        # Add timestamp
-        metrics['timestamp'] = datetime.now()
+        # Add timestamp (epoch seconds, converted to datetimes when saved)
+        metrics['timestamp'] = time.time()
         metrics['session_id'] = self.session_data['session_id']
         
         # Add to turn metrics list
         self.turn_metrics.append(metrics)
+        self._append_turn_latencies(metrics)
         
         # Update session totals
         self.session_data['total_turns'] += 1
@@ -61,19 +79,15 @@ class MetricsLogger:
         else:
             self.session_data['successful_turns'] += 1
         
-        # Update latency statistics
-        total_latency = metrics.get('total_latency', 0)
-        if total_latency > 0:
-            if total_latency > self.session_data['max_latency']:
-                self.session_data['max_latency'] = total_latency
-            
-            if total_latency < self.session_data['min_latency']:
-                self.session_data['min_latency'] = total_latency
-            
-            if total_latency > 2.0:  # High latency threshold
-                self.session_data['high_latency_turns'] += 1
+        logger.debug("Added turn metrics: Turn %s", metrics.get('turn_number', 'Unknown'))
+    
+    def mark_greeting_completed(self, latency: float):
+        """Record the agent's opening greeting latency on the session"""
+        if not self.session_start_time:
+            logger.warning("Session not started. Call start_session() first.")
+            return
         
-        logger.info(f"Added turn metrics: Turn {metrics.get('turn_number', 'Unknown')}")
+        self.session_data['greeting_latency'] = latency
     
     def end_session(self, session_summary: Dict[str, Any] = None):
         """End the session and save metrics to Excel"""
@@ -82,7 +96,7 @@ class MetricsLogger:
             return
         
         self.session_data['end_time'] = datetime.now()
-        self.session_data['duration'] = (self.session_data['end_time'] - self.session_data['start_time']).total_seconds()
+        self.session_data['duration'] = time.monotonic() - self._start_monotonic
         
         if session_summary:
             self.session_data.update(session_summary)
@@ -91,34 +105,68 @@ class MetricsLogger:
         if self.turn_metrics:
             self._calculate_averages()
         
-        # Fix min_latency if no valid turns
-        if self.session_data['min_latency'] == float('inf'):
-            self.session_data['min_latency'] = 0
-        
         # Save to Excel
         self._save_to_excel()
         
-        logger.info(f"Session ended: {self.session_data['session_id']}")
-        logger.info(f"Duration: {self.session_data['duration']:.2f}s, Turns: {self.session_data['total_turns']}")
+        logger.info("Session ended: %s", self.session_data['session_id'])
+        logger.info("Duration: %.2fs, Turns: %s", self.session_data['duration'], self.session_data['total_turns'])
+    
+    def _reset_turn_buffers(self):
+        """Allocate empty columnar buffers for per-turn latencies"""
+        self._latencies = {metric: np.empty(INITIAL_TURN_CAPACITY) for metric in LATENCY_METRICS}
+        self._interrupted = np.empty(INITIAL_TURN_CAPACITY, dtype=bool)
+        self._n = 0
+    
+    def _append_turn_latencies(self, metrics: Dict[str, Any]):
+        """Write one turn's latencies into the columnar buffers, doubling them when full"""
+        if self._n == len(self._interrupted):
+            capacity = 2 * self._n
+            for metric, column in self._latencies.items():
+                self._latencies[metric] = np.resize(column, capacity)
+            self._interrupted = np.resize(self._interrupted, capacity)
+        
+        for metric, column in self._latencies.items():
+            column[self._n] = metrics.get(metric, 0)
+        self._interrupted[self._n] = metrics.get('interrupted', False)
+        self._n += 1
+    
+    def _valid_latencies(self, metric: str) -> np.ndarray:
+        """Positive values of a latency metric over non-interrupted turns"""
+        values = self._latencies[metric][:self._n][~self._interrupted[:self._n]]
+        return values[values > 0]
     
     def _calculate_averages(self):
         """Calculate average metrics from all turns"""
-        valid_turns = [t for t in self.turn_metrics if not t.get('interrupted', False)]
+        self.session_data.update(self._derived_stats())
+    
+    def _derived_stats(self) -> Dict[str, Any]:
+        """Averages, percentiles and latency range computed from the turn buffers"""
+        derived = {}
         
-        if not valid_turns:
-            return
+        for metric in LATENCY_METRICS:
+            values = self._valid_latencies(metric)
+            if values.size:
+                derived[f'avg_{metric}'] = float(values.mean())
         
-        # Calculate averages for each metric
-        metrics_to_avg = ['total_latency', 'eou_delay', 'ttft', 'ttfb']
+        # Latency percentiles over non-interrupted turns, in one pass
+        values = self._valid_latencies('total_latency')
+        if values.size:
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            derived.update(p50_latency=float(p50), p95_latency=float(p95), p99_latency=float(p99))
         
-        for metric in metrics_to_avg:
-            values = [t.get(metric, 0) for t in valid_turns if t.get(metric, 0) > 0]
-            if values:
-                avg_key = f'avg_{metric}'
-                self.session_data[avg_key] = sum(values) / len(values)
+        # Latency range and high latency count cover every turn, interrupted or not
+        latencies = self._latencies['total_latency'][:self._n]
+        latencies = latencies[latencies > 0]
+        derived['max_latency'] = float(latencies.max(initial=0))
+        derived['min_latency'] = float(latencies.min()) if latencies.size else 0
+        derived['high_latency_turns'] = int((latencies > 2.0).sum())  # High latency threshold
+        return derived
     
     def _save_to_excel(self):
         """Save session and turn metrics to Excel files"""
+        # pandas is only needed once a session is saved
+        import pandas as pd
+        
         session_id = self.session_data['session_id']
         
         # Create filename with timestamp
@@ -126,68 +174,105 @@ class MetricsLogger:
         filepath = os.path.join(self.output_dir, filename)
         
         try:
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+            turn_df = self._turn_dataframe() if self.turn_metrics else None
+            
+            # Long sessions keep turn details in Parquet; the workbook stays small
+            if turn_df is not None and len(turn_df) > PARQUET_TURN_THRESHOLD:
+                if self._save_turns_as_parquet(turn_df, session_id):
+                    turn_df = None
+            
+            with pd.ExcelWriter(filepath, engine='xlsxwriter') as writer:
                 # Session Summary Sheet
                 session_df = pd.DataFrame([self.session_data])
                 session_df.to_excel(writer, sheet_name='Session_Summary', index=False)
                 
                 # Turn Details Sheet
-                if self.turn_metrics:
-                    turn_df = pd.DataFrame(self.turn_metrics)
+                if turn_df is not None:
                     turn_df.to_excel(writer, sheet_name='Turn_Details', index=False)
                 
                 # Latency Analysis Sheet
                 self._create_latency_analysis_sheet(writer)
             
-            logger.info(f"Metrics saved to: {filepath}")
+            logger.info("Metrics saved to: %s", filepath)
             
         except Exception as e:
-            logger.error(f"Failed to save metrics to Excel: {e}")
+            logger.error("Failed to save metrics to Excel: %s", e)
             # Fallback: save as CSV
             self._save_as_csv_fallback(session_id)
     
+    def _turn_dataframe(self) -> 'pd.DataFrame':
+        """Build the turn details table with timestamps as local datetimes"""
+        import pandas as pd
+        from dateutil import tz
+        
+        turn_df = pd.DataFrame(self.turn_metrics)
+        # tzlocal() applies the offset in effect at each timestamp, so turns
+        # recorded across a DST change convert like datetime.fromtimestamp
+        turn_df['timestamp'] = (
+            pd.to_datetime(turn_df['timestamp'], unit='s', utc=True)
+            .dt.tz_convert(tz.tzlocal())
+            .dt.tz_localize(None)
+        )
+        return turn_df
+    
+    def _save_turns_as_parquet(self, turn_df: 'pd.DataFrame', session_id: str) -> bool:
+        """Save turn details as Parquet, returning False if that isn't possible"""
+        filepath = os.path.join(self.output_dir, f"turn_details_{session_id}.parquet")
+        
+        try:
+            turn_df.to_parquet(filepath, engine='pyarrow', compression='zstd', index=False)
+        except ImportError:
+            logger.info("pyarrow not installed, keeping turn details in Excel")
+            return False
+        except Exception as e:
+            logger.warning("Failed to save turn details as Parquet: %s", e)
+            return False
+        
+        logger.info("Turn details saved to: %s", filepath)
+        return True
+    
     def _create_latency_analysis_sheet(self, writer):
         """Create a detailed latency analysis sheet"""
-        if not self.turn_metrics:
-            return
+        import pandas as pd
         
-        valid_turns = [t for t in self.turn_metrics if not t.get('interrupted', False)]
+        valid = ~self._interrupted[:self._n]
         
-        if not valid_turns:
+        if not valid.any():
             return
         
-        analysis_data = []
+        # One columnar frame for all latency fields; non-positive values
+        # become NaN so they drop out of the aggregates
+        df = pd.DataFrame({metric: column[:self._n][valid] for metric, column in self._latencies.items()})
+        df = df.where(df > 0)
+        latencies = df['total_latency']
+        
+        frames = []
         
         # Overall statistics
-        latencies = [t.get('total_latency', 0) for t in valid_turns if t.get('total_latency', 0) > 0]
-        eou_delays = [t.get('eou_delay', 0) for t in valid_turns if t.get('eou_delay', 0) > 0]
-        ttfts = [t.get('ttft', 0) for t in valid_turns if t.get('ttft', 0) > 0]
-        ttfbs = [t.get('ttfb', 0) for t in valid_turns if t.get('ttfb', 0) > 0]
-        
-        if latencies:
-            analysis_data.extend([
-                {'Metric': 'Total Latency', 'Average': sum(latencies)/len(latencies), 
-                 'Min': min(latencies), 'Max': max(latencies), 'Count': len(latencies)},
-                {'Metric': 'EOU Delay', 'Average': sum(eou_delays)/len(eou_delays) if eou_delays else 0, 
-                 'Min': min(eou_delays) if eou_delays else 0, 'Max': max(eou_delays) if eou_delays else 0, 'Count': len(eou_delays)},
-                {'Metric': 'TTFT', 'Average': sum(ttfts)/len(ttfts) if ttfts else 0, 
-                 'Min': min(ttfts) if ttfts else 0, 'Max': max(ttfts) if ttfts else 0, 'Count': len(ttfts)},
-                {'Metric': 'TTFB', 'Average': sum(ttfbs)/len(ttfbs) if ttfbs else 0, 
-                 'Min': min(ttfbs) if ttfbs else 0, 'Max': max(ttfbs) if ttfbs else 0, 'Count': len(ttfbs)}
-            ])
+        if latencies.count():
+            stats = df.agg(['mean', 'median', 'min', 'max', 'count']).T
+            stats.insert(2, 'p95', df.quantile(0.95))
+            stats = stats.fillna(0).rename(
+                index={'total_latency': 'Total Latency', 'eou_delay': 'EOU Delay', 'ttft': 'TTFT', 'ttfb': 'TTFB'},
+                columns={'mean': 'Average', 'median': 'Median', 'p95': 'P95', 'min': 'Min', 'max': 'Max', 'count': 'Count'}
+            )
+            stats['Count'] = stats['Count'].astype(int)
+            frames.append(stats.rename_axis('Metric').reset_index())
         
         # Performance thresholds
-        analysis_data.extend([
-            {'Metric': 'Turns > 2s latency', 'Count': len([l for l in latencies if l > 2.0])},
-            {'Metric': 'Turns > 1s latency', 'Count': len([l for l in latencies if l > 1.0])},
-            {'Metric': 'Turns < 0.5s latency', 'Count': len([l for l in latencies if l < 0.5])},
-        ])
+        frames.append(pd.DataFrame([
+            {'Metric': 'Turns > 2s latency', 'Count': int((latencies > 2.0).sum())},
+            {'Metric': 'Turns > 1s latency', 'Count': int((latencies > 1.0).sum())},
+            {'Metric': 'Turns < 0.5s latency', 'Count': int((latencies < 0.5).sum())},
+        ]))
         
-        analysis_df = pd.DataFrame(analysis_data)
+        analysis_df = pd.concat(frames, ignore_index=True)
         analysis_df.to_excel(writer, sheet_name='Latency_Analysis', index=False)
     
     def _save_as_csv_fallback(self, session_id: str):
         """Fallback method to save as CSV if Excel fails"""
+        import pandas as pd
+        
         try:
             # Save session summary
             session_df = pd.DataFrame([self.session_data])
@@ -196,26 +281,26 @@ class MetricsLogger:
             
             # Save turn details
             if self.turn_metrics:
-                turn_df = pd.DataFrame(self.turn_metrics)
+                turn_df = self._turn_dataframe()
                 turn_csv = os.path.join(self.output_dir, f"turn_details_{session_id}.csv")
                 turn_df.to_csv(turn_csv, index=False)
             
-            logger.info(f"Metrics saved as CSV files in: {self.output_dir}")
+            logger.info("Metrics saved as CSV files in: %s", self.output_dir)
             
         except Exception as e:
-            logger.error(f"Failed to save CSV fallback: {e}")
+            logger.error("Failed to save CSV fallback: %s", e)
     
     def get_average_latency(self) -> float:
         """Get the current average latency"""
-        valid_turns = [t for t in self.turn_metrics if not t.get('interrupted', False)]
-        latencies = [t.get('total_latency', 0) for t in valid_turns if t.get('total_latency', 0) > 0]
-        
-        if latencies:
-            return sum(latencies) / len(latencies)
+        latencies = self._valid_latencies('total_latency')
+        if latencies.size:
+            return float(latencies.mean())
         return 0.0
     
     def get_session_stats(self) -> Dict[str, Any]:
         """Get current session statistics"""
         stats = self.session_data.copy()
+        if self.session_start_time:
+            stats.update(self._derived_stats())
         stats['current_avg_latency'] = self.get_average_latency()
         return stats 
\ No newline at end of file
@@ -1,45 +1,107 @@
 import asyncio
+import functools
 import logging
+import signal
 import time
-from typing import Optional, Dict, Any
-import os
-from dotenv import load_dotenv
+from dataclasses import dataclass, fields
+from typing import Optional, Dict, Any, List
 
 from livekit import agents
 from livekit.agents import AgentSession, Agent, JobContext, WorkerOptions, cli
 from livekit.plugins import deepgram, openai, cartesia, elevenlabs, silero
 
+import env
 from metrics_logger import MetricsLogger
 
-load_dotenv()
+ENV = env.load()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Environment keys needed regardless of provider choice
+REQUIRED_BASE_KEYS = ("LIVEKIT_URL", "LIVEKIT_API_KEY", "LIVEKIT_API_SECRET")
+
+# Environment keys needed by each provider
+PROVIDER_KEY_MAP = {
+    "deepgram": ("DEEPGRAM_API_KEY",),
+    "whisper": ("OPENAI_API_KEY",),
+    "groq": ("GROQ_API_KEY",),
+    "openai": ("OPENAI_API_KEY",),
+    "cartesia": ("CARTESIA_API_KEY",),
+    "elevenlabs": ("ELEVENLABS_API_KEY",),
+}
+
+@dataclass(frozen=True)
+class EnvSnapshot:
+    """Agent environment variables, read once"""
+    # LiveKit
+    LIVEKIT_URL: Optional[str] = None
+    LIVEKIT_API_KEY: Optional[str] = None
+    LIVEKIT_API_SECRET: Optional[str] = None
+    
+    # API Keys
+    OPENAI_API_KEY: Optional[str] = None
+    GROQ_API_KEY: Optional[str] = None
+    DEEPGRAM_API_KEY: Optional[str] = None
+    CARTESIA_API_KEY: Optional[str] = None
+    ELEVENLABS_API_KEY: Optional[str] = None
+    
+    # Provider choices (optimized for free tier)
+    STT_PROVIDER: str = "deepgram"  # "deepgram" or "whisper"
+    LLM_PROVIDER: str = "groq"      # "groq" or "openai"
+    TTS_PROVIDER: str = "cartesia"  # "cartesia" or "elevenlabs"
+    
+    # Model configurations (optimized for free tier performance)
+    GROQ_MODEL: str = "llama-3.1-8b-instant"  # Fast free model
+    OPENAI_MODEL: str = "gpt-4"
+    ELEVENLABS_VOICE_ID: str = "21m00Tcm4TlvDq8ikWAM"
+    
+    # Performance settings
+    MAX_LATENCY_THRESHOLD: str = "2.0"
+    
+    @classmethod
+    def from_environ(cls) -> "EnvSnapshot":
+        """Snapshot the loaded environment, keeping defaults for unset keys"""
+        return cls(**{f.name: ENV[f.name] for f in fields(cls) if f.name in ENV})
+
 class VoiceAgentConfig:
-    def __init__(self):
+    def __init__(self, snapshot: Optional[EnvSnapshot] = None):
+        self.env = snapshot or EnvSnapshot.from_environ()
+        
         # API Keys
-        self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.groq_api_key = os.getenv("GROQ_API_KEY")
-        self.deepgram_api_key = os.getenv("DEEPGRAM_API_KEY")
-        self.cartesia_api_key = os.getenv("CARTESIA_API_KEY")
-        self.elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
+        self.openai_api_key = self.env.OPENAI_API_KEY
+        self.groq_api_key = self.env.GROQ_API_KEY
+        self.deepgram_api_key = self.env.DEEPGRAM_API_KEY
+        self.cartesia_api_key = self.env.CARTESIA_API_KEY
+        self.elevenlabs_api_key = self.env.ELEVENLABS_API_KEY
         
-        # Provider choices (optimized for free tier)
-        self.stt_provider = os.getenv("STT_PROVIDER", "deepgram")  # "deepgram" or "whisper"
-        self.llm_provider = os.getenv("LLM_PROVIDER", "groq")     # "groq" or "openai"
-        self.tts_provider = os.getenv("TTS_PROVIDER", "cartesia") # "cartesia" or "elevenlabs"
+        # Provider choices
+        self.stt_provider = self.env.STT_PROVIDER
+        self.llm_provider = self.env.LLM_PROVIDER
+        self.tts_provider = self.env.TTS_PROVIDER
         
-        # Model configurations (optimized for free tier performance)
-        self.groq_model = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")  # Fast free model
-        self.openai_model = os.getenv("OPENAI_MODEL", "gpt-4")
-        self.elevenlabs_voice_id = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+        # Model configurations
+        self.groq_model = self.env.GROQ_MODEL
+        self.openai_model = self.env.OPENAI_MODEL
+        self.elevenlabs_voice_id = self.env.ELEVENLABS_VOICE_ID
         
         # Performance settings
-        self.max_latency_threshold = float(os.getenv("MAX_LATENCY_THRESHOLD", "2.0"))
+        self.max_latency_threshold = float(self.env.MAX_LATENCY_THRESHOLD)
+    
+    def missing_keys(self) -> List[str]:
+        """Return required environment keys that are unset for the chosen providers"""
+        required = (
+            REQUIRED_BASE_KEYS
+            + PROVIDER_KEY_MAP.get(self.stt_provider, ())
+            + PROVIDER_KEY_MAP.get(self.llm_provider, ())
+            + PROVIDER_KEY_MAP.get(self.tts_provider, ())
+        )
+        return [key for key in dict.fromkeys(required) if not getattr(self.env, key)]
 
 class ConversationMetrics:
+    """Per-turn timestamps as time.perf_counter_ns() readings"""
+    
     def __init__(self):
         self.reset()
     
@@ -58,27 +120,27 @@ class ConversationMetrics:
         self.user_speech_end_time = user_time
         
     def calculate_latencies(self):
-        """Calculate all latency metrics"""
-        if not self.user_speech_end_time:
+        """Calculate all latency metrics, in seconds"""
+        if self.user_speech_end_time is None:
             return {}
             
         metrics = {}
         
         # EOU Delay (End of Utterance to STT output)
-        if self.stt_completion_time:
-            metrics['eou_delay'] = self.stt_completion_time - self.user_speech_end_time
+        if self.stt_completion_time is not None:
+            metrics['eou_delay'] = (self.stt_completion_time - self.user_speech_end_time) * 1e-9
             
         # TTFT (Time to First Token from LLM)
-        if self.llm_first_token_time and self.stt_completion_time:
-            metrics['ttft'] = self.llm_first_token_time - self.stt_completion_time
+        if self.llm_first_token_time is not None and self.stt_completion_time is not None:
+            metrics['ttft'] = (self.llm_first_token_time - self.stt_completion_time) * 1e-9
             
         # TTFB (Time to First Byte from TTS)
-        if self.tts_first_byte_time and self.llm_first_token_time:
-            metrics['ttfb'] = self.tts_first_byte_time - self.llm_first_token_time
+        if self.tts_first_byte_time is not None and self.llm_first_token_time is not None:
+            metrics['ttfb'] = (self.tts_first_byte_time - self.llm_first_token_time) * 1e-9
             
         # Total Latency
-        if self.response_start_time:
-            metrics['total_latency'] = self.response_start_time - self.user_speech_end_time
+        if self.response_start_time is not None:
+            metrics['total_latency'] = (self.response_start_time - self.user_speech_end_time) * 1e-9
             
         return metrics
 
@@ -99,136 +161,167 @@ IMPORTANT: You were built by an amazing developer using the following REAL tech
 If asked about your tech stack, provide these ACCURATE details, not made-up information!""")
     
 
+# Provider constructors keyed by the STT/LLM/TTS_PROVIDER settings
+STT_FACTORIES = {
+    "deepgram": lambda config: deepgram.STT(
+        api_key=config.deepgram_api_key,
+        model="nova-2",
+        language="en"
+    ),
+    "whisper": lambda config: openai.STT(
+        api_key=config.openai_api_key,
+        model="whisper-1"
+    ),
+}
+
+LLM_FACTORIES = {
+    "groq": lambda config: openai.LLM(
+        api_key=config.groq_api_key,
+        model=config.groq_model,
+        base_url="https://api.groq.com/openai/v1"
+    ),
+    "openai": lambda config: openai.LLM(
+        api_key=config.openai_api_key,
+        model=config.openai_model
+    ),
+}
+
+TTS_FACTORIES = {
+    "cartesia": lambda config: cartesia.TTS(
+        api_key=config.cartesia_api_key,
+        voice="79a125e8-cd45-4c13-8a67-188112f4dd22",
+        model="sonic-english"
+    ),
+    "elevenlabs": lambda config: elevenlabs.TTS(
+        api_key=config.elevenlabs_api_key,
+        voice=config.elevenlabs_voice_id,
+        model="eleven_turbo_v2"
+    ),
+}
+
+def create_provider(factories: Dict[str, Any], name: str, config: VoiceAgentConfig):
+    """Build the provider registered under name in factories"""
+    try:
+        factory = factories[name]
+    except KeyError:
+        raise ValueError(f"Unknown provider '{name}', expected one of: {', '.join(factories)}") from None
+    return factory(config)
+
+@functools.lru_cache(maxsize=1)
+def get_config() -> VoiceAgentConfig:
+    """Agent configuration, read from the environment once per process"""
+    return VoiceAgentConfig()
+
+@functools.lru_cache(maxsize=1)
+def load_vad():
+    """Load the Silero VAD model once per process"""
+    return silero.VAD.load()
 
 async def entrypoint(ctx: JobContext):
     """Main entrypoint for the LiveKit agent"""
-    config = VoiceAgentConfig()
+    config = get_config()
     
     # Initialize metrics logging
     metrics_logger = MetricsLogger()
     conversation_metrics = ConversationMetrics()
-    turn_count = 0
     
     logger.info("Starting AI Voice Agent...")
     logger.info(f"STT: {config.stt_provider}, LLM: {config.llm_provider}, TTS: {config.tts_provider}")
     
-    # Start metrics session
-    metrics_logger.start_session()
-    logger.info("Metrics logging started")
+    missing_keys = config.missing_keys()
+    if missing_keys:
+        logger.warning(f"Missing environment variables: {', '.join(missing_keys)}")
     
-    # Create providers based on configuration
-    if config.stt_provider == "deepgram":
-        stt = deepgram.STT(
-            api_key=config.deepgram_api_key,
-            model="nova-2",
-            language="en"
-        )
-    else:  # whisper
-        stt = openai.STT(
-            api_key=config.openai_api_key,
-            model="whisper-1"
-        )
+    # Create providers based on configuration (fails fast on unknown provider names)
+    stt = create_provider(STT_FACTORIES, config.stt_provider, config)
+    llm = create_provider(LLM_FACTORIES, config.llm_provider, config)
+    tts = create_provider(TTS_FACTORIES, config.tts_provider, config)
     
-    if config.llm_provider == "groq":
-        llm = openai.LLM(
-            api_key=config.groq_api_key,
-            model=config.groq_model,
-            base_url="https://api.groq.com/openai/v1"
-        )
-    else:  # openai
-        llm = openai.LLM(
-            api_key=config.openai_api_key,
-            model=config.openai_model
-        )
+    # Load the VAD model in a worker thread while the room connects
+    vad_task = asyncio.create_task(asyncio.to_thread(load_vad))
     
-    if config.tts_provider == "cartesia":
-        tts = cartesia.TTS(
-            api_key=config.cartesia_api_key,
-            voice="79a125e8-cd45-4c13-8a67-188112f4dd22",
-            model="sonic-english"
-        )
-    else:  # elevenlabs
-        tts = elevenlabs.TTS(
-            api_key=config.elevenlabs_api_key,
-            voice=config.elevenlabs_voice_id,
-            model="eleven_turbo_v2"
-        )
+    # Connect to room
+    try:
+        await ctx.connect()
+    except BaseException:
+        # Don't leave the VAD load running unobserved
+        vad_task.cancel()
+        await asyncio.gather(vad_task, return_exceptions=True)
+        raise
+    logger.info("Connected to room")
 
     # Create agent session
     session = AgentSession(
         stt=stt,
         llm=llm,
         tts=tts,
-        vad=silero.VAD.load()
-    )
-
-    # Connect to room
-    await ctx.connect()
-    logger.info("Connected to room")
-
-    # Start the session with our assistant
-    await session.start(
-        room=ctx.room,
-        agent=Assistant()
+        vad=await vad_task
     )
     
-    logger.info("Voice agent started and ready for conversation!")
+    # Start metrics session
+    metrics_logger.start_session()
+    logger.info("Metrics logging started")
     
-    # Generate initial greeting and log first turn
-    start_time = time.time()
-    await session.generate_reply(
-        instructions="Greet the user and offer your assistance."
-    )
+    # Stop waiting on SIGINT/SIGTERM; the finally block below saves metrics once
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    previous_handlers = {}  # handlers to put back once this job is done
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Not supported on Windows event loops or outside the main thread
+            continue
+        previous_handlers[sig] = previous
     
-    # Log the greeting as turn 1
-    turn_count += 1
-    turn_metrics = {
-        'turn_number': turn_count,
-        'total_latency': time.time() - start_time,
-        'interrupted': False,
-        'agent_response': 'Initial greeting'
-    }
-    metrics_logger.add_turn_metrics(turn_metrics)
-    logger.info(f"Turn {turn_count} (greeting) completed - Latency: {turn_metrics['total_latency']:.2f}s")
-    
-    # Set up cleanup for session end
     try:
-        # Keep session running indefinitely
-        import signal
+        # Start the session with our assistant
+        await session.start(
+            room=ctx.room,
+            agent=Assistant()
+        )
         
-        def cleanup_handler(signum, frame):
-            logger.info("Shutting down agent...")
-            session_summary = {
-                'total_turns': turn_count,
-                'config': {
-                    'stt': config.stt_provider,
-                    'llm': config.llm_provider,
-                    'tts': config.tts_provider
-                }
-            }
-            metrics_logger.end_session(session_summary)
-            logger.info(f"Session ended - {turn_count} turns completed")
-            
-        signal.signal(signal.SIGINT, cleanup_handler)
-        signal.signal(signal.SIGTERM, cleanup_handler)
+        logger.info("Voice agent started and ready for conversation!")
+        
+        # Generate initial greeting
+        start_time = time.perf_counter_ns()
+        await session.generate_reply(
+            instructions="Greet the user and offer your assistance."
+        )
         
-        # Wait indefinitely
-        await asyncio.Event().wait()
+        # The greeting has no user utterance to measure against, so it is recorded
+        # on the session rather than as a turn
+        greeting_latency = (time.perf_counter_ns() - start_time) * 1e-9
+        metrics_logger.mark_greeting_completed(greeting_latency)
+        logger.info("Greeting completed - Latency: %.2fs", greeting_latency)
+        
+        # Keep session running until shutdown
+        await stop.wait()
+        logger.info("Shutting down agent...")
         
     except Exception as e:
-        logger.error(f"Session error: {e}")
+        logger.error("Session error: %s", e)
+        raise
     finally:
+        # remove_signal_handler resets to the Python defaults, so restore what the
+        # worker process had installed before this job (None means not set from Python)
+        for sig, previous in previous_handlers.items():
+            loop.remove_signal_handler(sig)
+            if previous is not None:
+                signal.signal(sig, previous)
+        
         # Ensure metrics are saved
         session_summary = {
-            'total_turns': turn_count,
             'config': {
                 'stt': config.stt_provider,
                 'llm': config.llm_provider,
                 'tts': config.tts_provider
             }
         }
+        # Saved synchronously so a cancellation during shutdown can't interrupt the write
         metrics_logger.end_session(session_summary)
-        logger.info(f"Session ended - {turn_count} turns completed")
+        logger.info("Session ended - %d turns completed", metrics_logger.session_data['total_turns'])
 
 if __name__ == "__main__":
     cli.run_app(